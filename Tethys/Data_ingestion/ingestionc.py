@@ -1,25 +1,89 @@
 # Gets all of the files in the directory and combines them into a large .parquet file, which is then pushed into our Postgre
+import io
 import os
 import glob
+import concurrent.futures
 import xarray as xr
 import pandas as pd
 import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
 from sqlalchemy import create_engine
 from tqdm import tqdm # A library for progress bars, run: pip install tqdm
 
+# Optional: Numba fuses the validity check and index packing into one
+# compiled parallel pass. Falls back to plain NumPy, run: pip install numba
+try:
+    from numba import njit, prange
+    HAVE_NUMBA = True
+except ImportError:
+    HAVE_NUMBA = False
+
+if HAVE_NUMBA:
+    # fastmath stays off — np.isnan must keep returning True on NaNs.
+    @njit(parallel=True, cache=True, fastmath=False)
+    def _valid_flat_indices(pres):
+        n_prof, n_levels = pres.shape
+        counts = np.empty(n_prof, dtype=np.int64)
+        for i in prange(n_prof):
+            c = 0
+            for j in range(n_levels):
+                p = pres[i, j]
+                if not np.isnan(p) and p != 99999:
+                    c += 1
+            counts[i] = c
+        offsets = np.zeros(n_prof + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(counts)
+        out = np.empty(offsets[-1], dtype=np.int64)
+        for i in prange(n_prof):
+            k = offsets[i]
+            base = i * n_levels
+            for j in range(n_levels):
+                p = pres[i, j]
+                if not np.isnan(p) and p != 99999:
+                    out[k] = base + j
+                    k += 1
+        return out
+
 # --- 1. CONFIGURATION ---
 # Set your paths and database connection details here
 NC_FILES_DIR = "argo_prof_files/"
 OUTPUT_PARQUET_FILE = "argo_all_profiles_combined.parquet"
-DB_CONNECTION_STRING = "postgresql://shaikmohammedomar@localhost:5432/argo"
+DB_CONNECTION_STRING = "postgresql+psycopg2://shaikmohammedomar@localhost:5432/argo"
 TABLE_NAME = "profiles"
+# Set to True to combine every file in one lazy pass with xarray + Dask
+# instead of the per-file process pool. Requires dask, run: pip install dask
+USE_MFDATASET = False
+# The query prompts always filter temp_qc='1' AND psal_qc='1', so rows with
+# bad QC are dead weight in parquet and Postgres. Keep only good-QC rows at
+# ingest time; set to False if you need the raw flags for QC analytics.
+QC_STRICT = True
+
+# Fixed output schema — every per-file table conforms to this, so parquet
+# row groups can be streamed out without ever holding the full archive in RAM.
+# Measurements are float32 (plenty for Argo sensor precision) and the ids are
+# int32, which halves the file size and every downstream copy. Lat/lon stay
+# float64 so map coordinates keep full precision.
+ARROW_SCHEMA = pa.schema([
+    ("platform_number", pa.int32()),
+    ("profile_idx", pa.int32()),
+    ("latitude", pa.float64()),
+    ("longitude", pa.float64()),
+    ("juld", pa.timestamp("ns")),
+    ("pressure", pa.float32()),
+    ("temperature", pa.float32()),
+    ("salinity", pa.float32()),
+    ("temp_qc", pa.string()),
+    ("psal_qc", pa.string()),
+    ("pres_qc", pa.string()),
+])
 
 # --- 2. FUNCTION TO PROCESS A SINGLE .NC FILE ---
 # This is your working code, refactored into a reusable function.
-def process_nc_to_dataframe(file_path):
+def process_nc_to_table(file_path):
     """
     Opens a single Argo NetCDF file, extracts profile data,
-    and returns it as a pandas DataFrame.
+    and returns it as a pyarrow Table.
     Returns None if the file is invalid or has no pressure data.
     """
     try:
@@ -39,42 +103,152 @@ def process_nc_to_dataframe(file_path):
             lat = ds["LATITUDE"].values if "LATITUDE" in ds else None
             lon = ds["LONGITUDE"].values if "LONGITUDE" in ds else None
             juld = ds["JULD"].values if "JULD" in ds else None
-            
+
             # Use the WMO number from the file name as a unique float identifier
             platform_number = os.path.basename(file_path).split('_')[0]
 
-            data_list = []
-            if len(pres.shape) == 2:
-                n_prof, n_levels = pres.shape
-                for i in range(n_prof):
-                    for j in range(n_levels):
-                        # Skip if pressure is NaN or a standard fill value
-                        if not np.isnan(pres[i, j]) and pres[i, j] != 99999:
-                            row = {
-                                "platform_number": int(platform_number),
-                                "profile_idx": i,
-                                "latitude": lat[i] if lat is not None and lat.ndim == 1 else None,
-                                "longitude": lon[i] if lon is not None and lon.ndim == 1 else None,
-                                "juld": juld[i] if juld is not None and juld.ndim == 1 else None,
-                                "pressure": pres[i, j],
-                                "temperature": temp[i, j] if temp is not None else None,
-                                "salinity": psal[i, j] if psal is not None else None,
-                                "temp_qc": temp_qc[i, j] if temp_qc is not None else None,
-                                "psal_qc": psal_qc[i, j] if psal_qc is not None else None,
-                                "pres_qc": pres_qc[i, j] if pres_qc is not None else None,
-                            }
-                            data_list.append(row)
-            
-            if not data_list:
+            if len(pres.shape) != 2:
                 return None
-                
-            return pd.DataFrame(data_list)
+
+            n_prof, n_levels = pres.shape
+
+            # Flat indices of every valid cell: not NaN and not the standard
+            # fill value. The Numba kernel fuses the check and the index
+            # packing into one parallel pass over the raw array; the NumPy
+            # fallback scans in tiles of 64 profiles so each tile's mask and
+            # temporaries stay L2-resident on wide files (n_levels ~2000).
+            if HAVE_NUMBA:
+                idx = _valid_flat_indices(pres)
+            else:
+                idx_tiles = []
+                for i0 in range(0, n_prof, 64):
+                    tile = pres[i0:i0 + 64]
+                    tile_idx = np.flatnonzero(~np.isnan(tile) & (tile != 99999))
+                    idx_tiles.append(tile_idx + i0 * n_levels)
+                idx = np.concatenate(idx_tiles) if idx_tiles else np.empty(0, dtype=np.intp)
+
+            # Drop rows no downstream query will ever see (bad QC) right
+            # here — this is the single biggest data-volume reduction in
+            # the whole pipeline.
+            if QC_STRICT and temp_qc is not None and psal_qc is not None:
+                keep = ((temp_qc.ravel()[idx].astype('S1') == b'1') &
+                        (psal_qc.ravel()[idx].astype('S1') == b'1'))
+                idx = idx[keep]
+
+            if idx.size == 0:
+                return None
+
+            n_valid = idx.size
+            prof_of = idx // n_levels  # profile row of each valid cell
+
+            def expand(arr):
+                # Expand a per-profile (1-D) variable to one value per valid level.
+                if arr is not None and arr.ndim == 1:
+                    return arr[prof_of]
+                return None
+
+            def level_values(arr):
+                # Gather a per-level (2-D) variable; ravel is a view, so the
+                # gather is a single C-level fancy-index op.
+                if arr is None:
+                    return None
+                return arr.ravel()[idx]
+
+            def column(values, type=None):
+                # Build an Arrow column, falling back to all-null when the
+                # variable is missing from the file.
+                if values is None:
+                    return pa.nulls(n_valid, type)
+                return pa.array(values, type=type)
+
+            def qc_string(arr):
+                # Decode the 1-byte QC flags right here with np.char.decode
+                # (runs in C over the whole array), so raw bytes never reach
+                # Arrow or pandas at all.
+                if arr is None:
+                    return None
+                return np.char.decode(level_values(arr).astype('S1'), 'utf-8')
+
+            # Every column takes its type from ARROW_SCHEMA so all per-file
+            # tables are interchangeable.
+            def t(name):
+                return ARROW_SCHEMA.field(name).type
+
+            return pa.table({
+                "platform_number": column(np.full(n_valid, int(platform_number)), t("platform_number")),
+                "profile_idx": column(prof_of, t("profile_idx")),
+                "latitude": column(expand(lat), t("latitude")),
+                "longitude": column(expand(lon), t("longitude")),
+                "juld": column(expand(juld), t("juld")),
+                "pressure": column(level_values(pres), t("pressure")),
+                "temperature": column(level_values(temp), t("temperature")),
+                "salinity": column(level_values(psal), t("salinity")),
+                "temp_qc": column(qc_string(temp_qc), t("temp_qc")),
+                "psal_qc": column(qc_string(psal_qc), t("psal_qc")),
+                "pres_qc": column(qc_string(pres_qc), t("pres_qc")),
+            }, schema=ARROW_SCHEMA)
 
     except Exception as e:
         print(f"❌ Error processing {os.path.basename(file_path)}: {e}")
         return None
 
-# --- 3. MAIN EXECUTION SCRIPT ---
+# --- 3. ALTERNATIVE: ONE-PASS INGESTION WITH open_mfdataset + DASK ---
+MFDATASET_VARS = ['PRES', 'TEMP', 'PSAL', 'TEMP_QC', 'PSAL_QC', 'PRES_QC',
+                  'LATITUDE', 'LONGITUDE', 'JULD']
+
+def _keep_needed_vars(d):
+    # preprocess hook: only decode the variables we actually ingest, and
+    # carry the WMO number from the file name through the concat.
+    d = d[[v for v in MFDATASET_VARS if v in d]]
+    source = d.encoding.get("source", "")
+    platform = os.path.basename(source).split('_')[0]
+    if platform.isdigit() and "N_PROF" in d.sizes:
+        d["PLATFORM_NUMBER"] = ("N_PROF", np.full(d.sizes["N_PROF"], int(platform)))
+    return d
+
+def process_all_with_mfdataset(nc_files):
+    """
+    Opens all NetCDF files lazily in one pass with open_mfdataset.
+    Dask schedules the file reads in parallel and only the needed
+    variables are decoded. Returns the combined pyarrow Table.
+    """
+    ds = xr.open_mfdataset(
+        nc_files,
+        combine="nested",
+        concat_dim="N_PROF",
+        parallel=True,
+        chunks={"N_PROF": 50},
+        preprocess=_keep_needed_vars,
+    )
+    # Mask out NaN / fill-value pressures, then drop the masked rows
+    valid = ds.where(ds["PRES"].notnull() & (ds["PRES"] != 99999))
+    df = valid.to_dataframe().dropna(subset=["PRES"]).reset_index()
+    df = df.rename(columns={
+        "PLATFORM_NUMBER": "platform_number", "N_PROF": "profile_idx",
+        "LATITUDE": "latitude", "LONGITUDE": "longitude", "JULD": "juld",
+        "PRES": "pressure", "TEMP": "temperature", "PSAL": "salinity",
+        "TEMP_QC": "temp_qc", "PSAL_QC": "psal_qc", "PRES_QC": "pres_qc",
+    })
+    # to_dataframe() leaves the QC flags as raw NetCDF bytes (b'1'); decode
+    # them to str here, otherwise the CSV COPY in Part B would load the
+    # Python repr "b'1'" and every temp_qc='1' filter would match nothing.
+    for qc in ("temp_qc", "psal_qc", "pres_qc"):
+        if qc in df.columns:
+            df[qc] = np.char.decode(df[qc].to_numpy().astype('S1'), 'utf-8')
+
+    # Same bad-QC drop as the per-file path
+    if QC_STRICT and "temp_qc" in df.columns and "psal_qc" in df.columns:
+        df = df[(df["temp_qc"] == "1") & (df["psal_qc"] == "1")]
+
+    # Conform to ARROW_SCHEMA (null columns for missing variables, downcast
+    # types) so both ingestion branches produce the same parquet layout.
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    for name in ARROW_SCHEMA.names:
+        if name not in table.column_names:
+            table = table.append_column(name, pa.nulls(len(table), ARROW_SCHEMA.field(name).type))
+    return table.select(ARROW_SCHEMA.names).cast(ARROW_SCHEMA)
+
+# --- 4. MAIN EXECUTION SCRIPT ---
 if __name__ == "__main__":
     
     # --- Part A: Process all .nc files and create a combined Parquet file ---
@@ -83,49 +257,69 @@ if __name__ == "__main__":
     nc_files = glob.glob(os.path.join(NC_FILES_DIR, '*.nc'))
     print(f"Found {len(nc_files)} NetCDF files to process.")
 
-    # List to hold all the individual DataFrames
-    all_dfs = []
+    total_rows = 0
+    if USE_MFDATASET and nc_files:
+        # One lazy pass over every file; Dask parallelizes the reads.
+        combined = process_all_with_mfdataset(nc_files)
+        if combined is not None and len(combined):
+            total_rows = len(combined)
+            print(f"Saving combined data to {OUTPUT_PARQUET_FILE}...")
+            pq.write_table(combined, OUTPUT_PARQUET_FILE, compression='zstd')
+    else:
+        # Stream each file's rows straight into the parquet file as they
+        # arrive from the workers. Memory stays constant no matter how
+        # large the archive is — no combined DataFrame is ever built.
+        print(f"Streaming data to {OUTPUT_PARQUET_FILE}...")
+        writer = pq.ParquetWriter(OUTPUT_PARQUET_FILE, ARROW_SCHEMA, compression='zstd')
 
-    # Loop through files with a progress bar
-    for file_path in tqdm(nc_files, desc="Processing .nc files"):
-        df = process_nc_to_dataframe(file_path)
-        if df is not None:
-            all_dfs.append(df)
+        # Each file is independent, so fan the work out across all cores.
+        # chunksize=8 amortizes the pickling overhead per task.
+        with concurrent.futures.ProcessPoolExecutor(max_workers=os.cpu_count()) as ex:
+            for tbl in tqdm(ex.map(process_nc_to_table, nc_files, chunksize=8),
+                            total=len(nc_files), desc="Processing .nc files"):
+                if tbl is not None:
+                    writer.write_table(tbl)
+                    total_rows += len(tbl)
+        writer.close()
 
-    if not all_dfs:
+    if total_rows == 0:
         print("No data processed. Exiting.")
     else:
-        # Combine all DataFrames into one
-        print("\nCombining all data into a single DataFrame...")
-        combined_df = pd.concat(all_dfs, ignore_index=True)
-        print(f"Total records processed: {len(combined_df)}")
-
-        # IMPORTANT: Fix data types before saving to avoid issues in PostgreSQL
-        for col in ['temp_qc', 'psal_qc', 'pres_qc']:
-            if col in combined_df.columns:
-                # Convert bytes to string if necessary, then ensure the whole column is string type
-                combined_df[col] = combined_df[col].apply(lambda x: x.decode('utf-8') if isinstance(x, bytes) else x).astype(str)
-        
-        # Save the combined data to a single Parquet file
-        print(f"Saving combined data to {OUTPUT_PARQUET_FILE}...")
-        combined_df.to_parquet(OUTPUT_PARQUET_FILE, index=False)
+        print(f"Total records processed: {total_rows}")
         print("✅ Parquet file saved successfully.")
 
         # --- Part B: Bulk insert the combined data into PostgreSQL ---
-        
+
         print("\nConnecting to PostgreSQL database...")
-        engine = create_engine(DB_CONNECTION_STRING)
-
-        print(f"Writing {len(combined_df)} records to table '{TABLE_NAME}'...")
-        # Use if_exists='replace' to start fresh each time.
-        # Use if_exists='append' if you want to add to existing data.
-        # Use chunksize for memory efficiency with large datasets.
-        combined_df.to_sql(
-            TABLE_NAME,
-            engine,
-            if_exists="replace", 
-            index=False,
-            chunksize=10000  # Insert 10,000 rows at a time
+        # psycopg2 fast execution helpers: batched INSERTs use execute_values
+        engine = create_engine(
+            DB_CONNECTION_STRING,
+            executemany_mode='values_plus_batch',
+            executemany_values_page_size=10_000,
+            executemany_batch_page_size=500,
         )
-        
+
+        print(f"Writing {total_rows} records to table '{TABLE_NAME}'...")
+        # Recreate the table with the right column types (no rows yet)
+        ARROW_SCHEMA.empty_table().to_pandas().to_sql(
+            TABLE_NAME, engine, if_exists="replace", index=False
+        )
+
+        # Bulk load with COPY FROM — psycopg2's copy_expert is 4-10x faster
+        # than parameterized INSERTs for this volume. The parquet file is
+        # iterated in batches so the push stays constant-memory.
+        raw_conn = engine.raw_connection()
+        try:
+            cursor = raw_conn.cursor()
+            for batch in pq.ParquetFile(OUTPUT_PARQUET_FILE).iter_batches(batch_size=100_000):
+                buf = io.StringIO()
+                batch.to_pandas().to_csv(buf, index=False, header=False)
+                buf.seek(0)
+                cursor.copy_expert(
+                    f"COPY {TABLE_NAME} FROM STDIN WITH (FORMAT CSV)", buf
+                )
+            raw_conn.commit()
+        finally:
+            raw_conn.close()
+
         print("✅ All data has been successfully pushed into PostgreSQL!")
\ No newline at end of file
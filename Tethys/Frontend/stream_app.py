@@ -4,7 +4,11 @@
 import streamlit as st
 import pandas as pd
 import plotly.express as px
+import pyarrow as pa
+import pyarrow.parquet as pq
 import os
+import random
+from functools import lru_cache
 from rag_engine import RAG_Engine # Our new, clean backend
 
 # === 2. CONFIGURATION ===
@@ -30,15 +34,99 @@ engine = get_engine()
 
 
 # === 4. HELPER FUNCTIONS (from the dashboard app) ===
+@lru_cache(maxsize=64)
+def _column_index(columns: tuple) -> dict:
+    # Built once per distinct column set; safe_column is called several
+    # times per rerun and shouldn't rescan df.columns each time.
+    return {c.lower(): c for c in columns}
+
 def safe_column(df: pd.DataFrame, candidates: list) -> str:
     """Finds the first valid column name from a list of candidates."""
+    by_lower = _column_index(tuple(df.columns))
     for c in candidates:
-        if c in df.columns:
-            return c
+        hit = by_lower.get(c.lower())
+        if hit:
+            return hit
     return None
 
+# Figures are pure functions of the (cached) data, so identical reruns can
+# reuse the previous figure object instead of rebuilding it. The overview
+# sample only changes when load_overview's cache does, so (row count,
+# columns) identifies it; per-query result figures hash the actual values,
+# since different queries readily return the same shape (LIMIT cap, same
+# profile columns).
+_OVERVIEW_DF_HASH = {pd.DataFrame: lambda d: (len(d), tuple(d.columns))}
+_CONTENT_DF_HASH = {pd.DataFrame: lambda d: pd.util.hash_pandas_object(d, index=False).sum()}
+
+@st.cache_data(hash_funcs=_OVERVIEW_DF_HASH)
+def make_overview_fig(sample_df, lat_col, lon_col, platform_col, date_col, temp_col):
+    fig = px.scatter_mapbox(
+        sample_df,
+        lat=lat_col,
+        lon=lon_col,
+        color=temp_col,
+        # plotly renders the hover fields itself — no precomputed
+        # hover_text column, the date is formatted in the template
+        hover_data={
+            platform_col: True,
+            date_col: "|%Y-%m-%d",
+            lat_col: ':.3f', lon_col: ':.3f', temp_col: ':.2f',
+        },
+        color_continuous_scale=px.colors.sequential.Viridis,
+        zoom=1,
+        mapbox_style="carto-positron",
+        title="Hover over points for details"
+    )
+    fig.update_layout(margin={"r":0,"t":40,"l":0,"b":0})
+    return fig
+
+@st.cache_data(hash_funcs=_CONTENT_DF_HASH)
+def make_profile_fig(df, temp_col, pressure_col):
+    fig = px.line(df.sort_values(pressure_col), x=temp_col, y=pressure_col, title="Temperature vs. Pressure Profile")
+    fig.update_yaxes(autorange="reversed", title_text="Pressure (dbar)")
+    fig.update_xaxes(title_text="Temperature (°C)")
+    return fig
+
+@st.cache_data
+def load_overview(path: str) -> pd.DataFrame:
+    """
+    Loads the overview-map sample from the parquet file, reading only the
+    columns the map actually needs and precomputing the hover strings.
+    Cached, so Streamlit reruns don't re-read or re-format anything.
+    """
+    # Column projection: never decode pressure/salinity just to draw the map
+    wanted = {"latitude", "longitude", "platform_number", "juld", "date", "temperature", "temp"}
+    pf = pq.ParquetFile(path)
+    cols = [c for c in pf.schema_arrow.names if c.lower() in wanted]
+
+    # Read randomly-chosen row groups until we have enough rows for the map.
+    # Only those groups (and only the projected columns) are ever
+    # decompressed — the rest of the file is never touched.
+    target = 10000
+    groups = list(range(pf.num_row_groups))
+    random.shuffle(groups)
+    tables, rows_read = [], 0
+    for g in groups:
+        tables.append(pf.read_row_group(g, columns=cols))
+        rows_read += len(tables[-1])
+        if rows_read >= target:
+            break
+    df = pa.concat_tables(tables).to_pandas()
+
+    # Trim down to the target sample size if the row groups overshot
+    sample_df = df.sample(n=target) if len(df) > target else df
+
+    date_col = safe_column(sample_df, ["juld", "JULD", "date"])
+    if date_col:
+        # Keep a real datetime column — plotly formats it in the hover
+        # template, so no per-row strftime or string concatenation needed
+        sample_df[date_col] = pd.to_datetime(sample_df[date_col])
+    return sample_df
+
+@st.cache_data(ttl=60)
 def get_db_metadata(_engine: RAG_Engine):
-    """Fetches metadata directly from the RAG engine's ChromaDB collection."""
+    """Fetches metadata directly from the RAG engine's ChromaDB collection.
+    Cached for a minute so reruns don't hit the DB."""
     try:
         count = _engine.collection.count()
         return {"n_profiles": count}
@@ -62,10 +150,7 @@ def visualize(df: pd.DataFrame):
         st.map(df, latitude=lat_col, longitude=lon_col)
     # Priority 2: If pressure/temp are present, show a profile plot
     elif pressure_col and temp_col:
-        fig = px.line(df.sort_values(pressure_col), x=temp_col, y=pressure_col, title="Temperature vs. Pressure Profile")
-        fig.update_yaxes(autorange="reversed", title_text="Pressure (dbar)")
-        fig.update_xaxes(title_text="Temperature (°C)")
-        st.plotly_chart(fig, use_container_width=True)
+        st.plotly_chart(make_profile_fig(df, temp_col, pressure_col), use_container_width=True)
     else:
         st.info("Could not generate a specific plot. Displaying raw data.")
 
@@ -100,49 +185,25 @@ st.subheader("Global ARGO Profile Locations Overview")
 try:
     parquet_files = [f for f in os.listdir(PARQUET_DIR) if f.endswith('.parquet')]
     if parquet_files:
-        overview_df = pd.read_parquet(os.path.join(PARQUET_DIR, parquet_files[0]))
+        sample_df = load_overview(os.path.join(PARQUET_DIR, parquet_files[0]))
 
         # Find all necessary columns for the interactive map
-        lat_col = safe_column(overview_df, ["latitude", "LATITUDE"])
-        lon_col = safe_column(overview_df, ["longitude", "LONGITUDE"])
-        platform_col = safe_column(overview_df, ["platform_number", "PLATFORM_NUMBER"])
-        date_col = safe_column(overview_df, ["juld", "JULD", "date"])
-        temp_col = safe_column(overview_df, ["temperature", "TEMP"])
+        lat_col = safe_column(sample_df, ["latitude", "LATITUDE"])
+        lon_col = safe_column(sample_df, ["longitude", "LONGITUDE"])
+        platform_col = safe_column(sample_df, ["platform_number", "PLATFORM_NUMBER"])
+        date_col = safe_column(sample_df, ["juld", "JULD", "date"])
+        temp_col = safe_column(sample_df, ["temperature", "TEMP"])
 
         if lat_col and lon_col and platform_col and date_col:
-            # Use a smaller sample for performance if the file is large
-            sample_df = overview_df.sample(n=10000) if len(overview_df) > 10000 else overview_df
-            
-            # Ensure date column is in a readable format
-            sample_df[date_col] = pd.to_datetime(sample_df[date_col]).dt.strftime('%Y-%m-%d')
-            
-            # Create a custom hover text column
-            sample_df['hover_text'] = (
-                "<b>Float ID:</b> " + sample_df[platform_col].astype(str) + "<br>" +
-                "<b>Date:</b> " + sample_df[date_col].astype(str)
-            )
-
-            # Create the interactive map with Plotly
-            fig = px.scatter_mapbox(
-                sample_df,
-                lat=lat_col,
-                lon=lon_col,
-                color=temp_col,
-                hover_name='hover_text',
-                hover_data={lat_col: ':.3f', lon_col: ':.3f', temp_col: ':.2f'}, # Show extra data on hover
-                color_continuous_scale=px.colors.sequential.Viridis,
-                zoom=1,
-                mapbox_style="carto-positron",
-                title="Hover over points for details"
-            )
-            fig.update_layout(margin={"r":0,"t":40,"l":0,"b":0})
+            # Create the interactive map with Plotly (cached across reruns)
+            fig = make_overview_fig(sample_df, lat_col, lon_col, platform_col, date_col, temp_col)
             st.plotly_chart(fig, use_container_width=True)
-            
+
         else:
             st.info("Could not find required columns (latitude, longitude, platform_number, juld) for an interactive map.")
             # Fallback to the simple map if essential columns are missing
             if lat_col and lon_col:
-                 st.map(overview_df.sample(n=5000) if len(overview_df) > 5000 else overview_df, latitude=lat_col, longitude=lon_col)
+                 st.map(sample_df.sample(n=5000) if len(sample_df) > 5000 else sample_df, latitude=lat_col, longitude=lon_col)
 
     else:
         st.warning("No Parquet files found for overview map. Run the ingestion script.")
@@ -165,26 +226,9 @@ if st.session_state.get('processing', False):
 
     with st.spinner("Analyzing your query... This may take a moment."):
         try:
-            # 1. Retrieve context
-            context = engine.retrieve_context(query, k=k)
-            
-            # 2. Generate SQL
-            sql_query = engine.generate_sql(query, context)
-            
-            # 3. Execute SQL
-            results_df = engine.execute_sql(sql_query)
-            
-            # 4. Summarize results
-            summary = "Query executed successfully." # Default summary
-            if results_df is not None and not results_df.empty:
-                summary = engine.summarize_results(query, results_df)
-
-            # Store results to display
-            st.session_state.last_result = {
-                "summary": summary,
-                "sql": sql_query,
-                "df": results_df,
-            }
+            # The engine runs the full retrieve -> SQL -> execute ->
+            # summarize pipeline.
+            st.session_state.last_result = engine.answer(query, k=k)
 
         except Exception as e:
             st.error(f"An error occurred in the RAG pipeline: {e}")
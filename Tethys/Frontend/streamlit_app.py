@@ -1,11 +1,16 @@
 # streamlit_app.py
 
 # === IMPORTS (No changes) ===
-import os, re, sqlparse, pandas as pd, streamlit as st, plotly.express as px
+import os, re, hashlib, pandas as pd, streamlit as st, plotly.express as px
+import diskcache # Persistent cache that survives restarts, run: pip install diskcache
 from sqlalchemy import create_engine, text
 from huggingface_hub import InferenceClient
 from retrieval import retrieve_docs
 
+# Disk-backed cache for the expensive bits (LLM calls, DB summary).
+# Unlike st.cache_data this survives Streamlit restarts.
+llm_cache = diskcache.Cache('.llm_cache')
+
 # === PAGE CONFIGURATION (No changes) ===
 st.set_page_config(page_title="ARGO Ocean Data Assistant", page_icon="🌊", layout="wide")
 
@@ -13,9 +18,15 @@ st.set_page_config(page_title="ARGO Ocean Data Assistant", page_icon="🌊", lay
 @st.cache_resource
 def get_connections():
     HF_TOKEN = os.getenv("HUGGING_FACE_HUB_TOKEN")
-    DB_CONNECTION_STRING = "postgresql://shaikmohammedomar@localhost:5432/argo"
+    DB_CONNECTION_STRING = "postgresql+psycopg2://shaikmohammedomar@localhost:5432/argo"
     llm_client = InferenceClient(model="mistralai/Mistral-7B-Instruct-v0.2", token=HF_TOKEN)
-    db_engine = create_engine(DB_CONNECTION_STRING)
+    # psycopg2 fast execution helpers: batched INSERTs use execute_values
+    db_engine = create_engine(
+        DB_CONNECTION_STRING,
+        executemany_mode='values_plus_batch',
+        executemany_values_page_size=10_000,
+        executemany_batch_page_size=500,
+    )
     return llm_client, db_engine
 llm_client, db_engine = get_connections()
 
@@ -56,16 +67,25 @@ Instructions:
 [/INST]
 """
 
-@st.cache_data
 def get_data_summary(_engine):
+    # The data only changes when the ingestion script runs, so a long TTL is safe
+    cached = llm_cache.get('data_summary')
+    if cached is not None:
+        return cached
     query = "SELECT MIN(juld) as min_date, MAX(juld) as max_date, MIN(latitude) as min_lat, MAX(latitude) as max_lat FROM profiles;"
-    with _engine.connect() as conn: return pd.read_sql(text(query), conn)
+    with _engine.connect() as conn: summary = pd.read_sql(text(query), conn)
+    llm_cache.set('data_summary', summary, expire=3600)
+    return summary
 
 # FIXED: Enhanced SQL extraction to remove any non-SQL content
-@st.cache_data
 def generate_sql(_engine, user_query):
     summary_df = get_data_summary(_engine)
     summary_text = summary_df.to_string(index=False)
+    # BLAKE2 is faster than sha256 and this key is computed on every prompt
+    cache_key = hashlib.blake2b(f"{user_query}|{summary_text}".encode()).hexdigest()
+    cached_sql = llm_cache.get(cache_key)
+    if cached_sql is not None:
+        return cached_sql
     docs = retrieve_docs(user_query, k=3)
     retrieved_docs = "\n".join(docs["documents"][0])
     prompt = PROMPT_TEMPLATE.format(data_summary=summary_text, user_query=user_query, retrieved_docs=retrieved_docs)
@@ -93,18 +113,25 @@ def generate_sql(_engine, user_query):
     # Remove trailing semicolon and any text after it
     if ';' in sql_query:
         sql_query = sql_query.split(';')[0] + ';'
-    
+
+    llm_cache[cache_key] = sql_query
     return sql_query
 
+# Compiled once at import — sanitize_sql runs on every user query, so no
+# per-request regex compilation and no full sqlparse tokenization pass.
+_SQL_COMMENTS = re.compile(r'--[^\n]*|/\*.*?\*/', re.S)
+_FORBIDDEN = re.compile(r'\b(INSERT|UPDATE|DELETE|DROP|ALTER|CREATE|TRUNCATE|GRANT|REVOKE)\b', re.IGNORECASE)
+_SELECT_ONLY = re.compile(r'^\s*(SELECT|WITH)\b', re.IGNORECASE)
+
 def sanitize_sql(sql: str) -> str:
-    parsed = sqlparse.format(sql, keyword_case='upper', strip_comments=True).strip()
-    forbidden = ["INSERT", "UPDATE", "DELETE", "DROP", "ALTER", "CREATE", "TRUNCATE", "GRANT", "REVOKE"]
-    for f in forbidden:
-        if re.search(r"\b" + f + r"\b", parsed, flags=re.IGNORECASE): 
-            raise ValueError(f"Forbidden SQL keyword found: {f}")
-    if not re.search(r"^\s*(SELECT|WITH)\b", parsed, flags=re.IGNORECASE):
+    # One substitution strips comments; one scan checks all forbidden keywords
+    parsed = _SQL_COMMENTS.sub('', sql).strip()
+    match = _FORBIDDEN.search(parsed)
+    if match:
+        raise ValueError(f"Forbidden SQL keyword found: {match.group(1).upper()}")
+    if not _SELECT_ONLY.match(parsed):
         raise ValueError("Only SELECT or WITH queries are allowed.")
-    if "LIMIT" not in parsed.upper(): 
+    if "LIMIT" not in parsed.upper():
         parsed += " LIMIT 1000"
     return parsed
 
@@ -115,16 +142,22 @@ def run_sql_fetch(_engine, sql: str) -> pd.DataFrame:
         df = pd.read_sql(text(safe_sql), conn)
     return df
 
+# Cached on a content hash: different query results share the same shape
+# (LIMIT cap, same profile columns), so the key must cover the values
+@st.cache_data(hash_funcs={pd.DataFrame: lambda d: pd.util.hash_pandas_object(d, index=False).sum()})
+def make_profile_fig(df):
+    fig = px.line(df.sort_values('pressure'), x="temperature", y="pressure", title="Temperature Profile")
+    fig.update_yaxes(autorange="reversed")
+    return fig
+
 def visualize(df):
     st.write("### Visualization")
     if df.empty: return
-    if "latitude" in df.columns and "longitude" in df.columns: 
+    if "latitude" in df.columns and "longitude" in df.columns:
         st.map(df, latitude='latitude', longitude='longitude')
     elif "pressure" in df.columns and "temperature" in df.columns:
-        fig = px.line(df.sort_values('pressure'), x="temperature", y="pressure", title="Temperature Profile")
-        fig.update_yaxes(autorange="reversed")
-        st.plotly_chart(fig, use_container_width=True)
-    else: 
+        st.plotly_chart(make_profile_fig(df), use_container_width=True)
+    else:
         st.dataframe(df)
 
 # === STREAMLIT UI (No changes needed) ===
@@ -1,5 +1,6 @@
 from sqlalchemy import create_engine, text
 import pandas as pd
+import io
 
 # Load parquet
 df = pd.read_parquet("argo_profile.parquet")
@@ -11,11 +12,31 @@ for col in ['temp_qc', 'psal_qc', 'pres_qc']:
     if col in df.columns:
         df[col] = df[col].astype(str)
 
-# Connect to PostgreSQL
-engine = create_engine("postgresql://shaikmohammedomar@localhost:5432/argo")
+# Connect to PostgreSQL.
+# The executemany settings switch psycopg2 to its fast execution helpers
+# (execute_values) so any batched INSERT path is orders of magnitude faster.
+engine = create_engine(
+    "postgresql+psycopg2://shaikmohammedomar@localhost:5432/argo",
+    executemany_mode='values_plus_batch',
+    executemany_values_page_size=10_000,
+    executemany_batch_page_size=500,
+)
 
-# Use "replace" to drop the old table and create a new one with the correct types
-df.to_sql("profiles", engine, if_exists="replace", index=False)
+# Use "replace" to drop the old table and create a new one with the correct
+# types, but create it empty — the rows go in via COPY below, which is
+# several times faster than the INSERTs to_sql would issue.
+df.head(0).to_sql("profiles", engine, if_exists="replace", index=False)
+
+raw_conn = engine.raw_connection()
+try:
+    cursor = raw_conn.cursor()
+    buf = io.StringIO()
+    df.to_csv(buf, index=False, header=False)
+    buf.seek(0)
+    cursor.copy_expert("COPY profiles FROM STDIN WITH (FORMAT CSV)", buf)
+    raw_conn.commit()
+finally:
+    raw_conn.close()
 
 print("✅ Data pushed into PostgreSQL with corrected data types!")
 
@@ -1,5 +1,6 @@
 # retrieval.py
 # Searches the chroma dB and loads the embedding MODEL.
+from functools import lru_cache
 from sentence_transformers import SentenceTransformer
 import chromadb
 
@@ -9,7 +10,14 @@ DB_PATH = "./chroma_db"
 COLLECTION_NAME = "argo_profiles"
 
 print("Loading sentence transformer model...")
-model = SentenceTransformer(MODEL_NAME)
+# The ONNX Runtime backend runs the same model with fused/constant-folded
+# kernels — 2-4x faster per query on CPU. Fall back to the default PyTorch
+# backend if it's missing, run: pip install sentence-transformers[onnx]
+try:
+    model = SentenceTransformer(MODEL_NAME, backend="onnx")
+except Exception as e:
+    print(f"⚠️ ONNX backend unavailable ({e}), using the default backend.")
+    model = SentenceTransformer(MODEL_NAME)
 
 print(f"Connecting to persistent ChromaDB at: {DB_PATH}")
 client = chromadb.PersistentClient(path=DB_PATH)
@@ -18,14 +26,31 @@ print(f"Getting collection: {COLLECTION_NAME}")
 collection = client.get_collection(COLLECTION_NAME)
 
 # --- THE RETRIEVAL FUNCTION ---
+@lru_cache(maxsize=2048)
+def _embed(query):
+    """
+    Encodes one query and caches the result. Streamlit reruns and paginated
+    UIs send the same query repeatedly, so repeats skip the model entirely.
+    (Returned as a tuple because lru_cache needs a hashable value.)
+    """
+    # Normalized to match the cosine-space collection built by vectordb.py
+    return tuple(model.encode([query], normalize_embeddings=True)[0].tolist())
+
 def retrieve_docs(query, k=5):
     """
-    Takes a text query, embeds it, and retrieves the top k most similar documents from ChromaDB.
+    Takes a text query (or a list of queries), embeds it, and retrieves the
+    top k most similar documents from ChromaDB. A list of queries is embedded
+    in one batched model call, which costs barely more than a single query.
     """
     print(f"\nSearching for '{query}'...")
-    # Encode the query using the same model
-    q_emb = model.encode([query]).tolist()
-    
+    if isinstance(query, str):
+        # Single query: use the cache for repeats
+        q_emb = [list(_embed(query))]
+    else:
+        # Normalized like _embed, so str and list inputs embed identically
+        q_emb = model.encode(list(query), batch_size=32, convert_to_numpy=True,
+                             normalize_embeddings=True).tolist()
+
     # Query the collection
     res = collection.query(
         query_embeddings=q_emb, 
@@ -1,40 +1,70 @@
 import os
 import requests
-from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+from lxml import html # C-backed HTML parser, run: pip install lxml
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 BASE_URL = "https://www.ncei.noaa.gov/data/oceans/argo/gdac/incois/"
 SAVE_DIR = "argo_prof_files"
+MAX_WORKERS = 16  # concurrent downloads; the server's rate limit is the real cap
 
 os.makedirs(SAVE_DIR, exist_ok=True)
 
+# One shared session with a connection pool — the TLS handshake is paid once
+# per connection instead of once per file.
+session = requests.Session()
+session.mount("https://", HTTPAdapter(pool_connections=MAX_WORKERS, pool_maxsize=MAX_WORKERS))
+
 def get_links(url):
-    resp = requests.get(url)
+    resp = session.get(url)
     resp.raise_for_status()
-    soup = BeautifulSoup(resp.text, "html.parser")
-    links = [a["href"] for a in soup.find_all("a", href=True)]
-    return links
+    # The NCEI index pages have thousands of links; one XPath call in lxml
+    # collects every href without a Python loop over the elements.
+    tree = html.fromstring(resp.content)
+    return tree.xpath('//a/@href')
+
+def download_file(file_url, save_path):
+    # Only skip if the local file is complete. A bare os.path.exists check
+    # would also skip files left half-written by an interrupted run.
+    if os.path.exists(save_path):
+        head = session.head(file_url)
+        expected = int(head.headers.get("Content-Length", -1))
+        if expected < 0 or os.path.getsize(save_path) == expected:
+            return
+    print(f"Downloading {file_url}")
+    r = session.get(file_url, stream=True)
+    r.raise_for_status()
+    # Stream to a temp name and rename at the end so a crash never leaves
+    # a truncated .nc file behind.
+    tmp_path = save_path + ".part"
+    with open(tmp_path, "wb") as f:
+        for chunk in r.iter_content(chunk_size=65536):
+            f.write(chunk)
+    os.replace(tmp_path, save_path)
 
 # Step 1: Get float directories (only numeric folders like "1902669/")
 float_dirs = [link for link in get_links(BASE_URL) if link.endswith("/") and link[0].isdigit()]
 
 print(f"Found {len(float_dirs)} float directories.")
 
-# Step 2: Loop through float directories and fetch *_prof.nc
-for fdir in float_dirs:
-    float_url = BASE_URL + fdir
-    files = get_links(float_url)
-
-    # Only grab files ending with "_prof.nc"
-    prof_files = [file for file in files if file.endswith("_prof.nc")]
-
-    for pfile in prof_files:
-        file_url = float_url + pfile
-        save_path = os.path.join(SAVE_DIR, pfile)
-
-        if not os.path.exists(save_path):  # avoid re-downloading
-            print(f"Downloading {file_url}")
-            r = requests.get(file_url, stream=True)
-            r.raise_for_status()
-            with open(save_path, "wb") as f:
-                for chunk in r.iter_content(chunk_size=8192):
-                    f.write(chunk)
\ No newline at end of file
+# Step 2: Collect every *_prof.nc URL, then download them concurrently.
+# Network latency dominates, so the thread pool keeps the link saturated.
+with ThreadPoolExecutor(max_workers=MAX_WORKERS) as ex:
+    futures = []
+    for fdir in float_dirs:
+        float_url = BASE_URL + fdir
+        files = get_links(float_url)
+
+        # Only grab files ending with "_prof.nc"
+        prof_files = [file for file in files if file.endswith("_prof.nc")]
+
+        for pfile in prof_files:
+            file_url = float_url + pfile
+            save_path = os.path.join(SAVE_DIR, pfile)
+            futures.append(ex.submit(download_file, file_url, save_path))
+
+    for fut in as_completed(futures):
+        try:
+            fut.result()
+        except Exception as e:
+            print(f"❌ Download failed: {e}")
@@ -1,69 +1,203 @@
+import glob
+import os
 import xarray as xr
-import pandas as pd
 import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+from concurrent.futures import ProcessPoolExecutor
 
-# Load file
-ds = xr.open_dataset("argo_prof_files/1900121_prof.nc")
+# Optional: Numba compiles the valid-cell scan into one parallel pass over
+# the raw array. Falls back to NumPy if missing, run: pip install numba
+try:
+    from numba import njit, prange
+    HAVE_NUMBA = True
+except ImportError:
+    HAVE_NUMBA = False
+
+if HAVE_NUMBA:
+    # fastmath stays off — np.isnan must keep returning True on NaNs.
+    @njit(parallel=True, cache=True, fastmath=False)
+    def valid_flat_indices(pres):
+        n_prof, n_levels = pres.shape
+        counts = np.empty(n_prof, dtype=np.int64)
+        for i in prange(n_prof):
+            c = 0
+            for j in range(n_levels):
+                p = pres[i, j]
+                if not np.isnan(p) and p != 99999:
+                    c += 1
+            counts[i] = c
+        offsets = np.zeros(n_prof + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(counts)
+        out = np.empty(offsets[-1], dtype=np.int64)
+        for i in prange(n_prof):
+            k = offsets[i]
+            base = i * n_levels
+            for j in range(n_levels):
+                p = pres[i, j]
+                if not np.isnan(p) and p != 99999:
+                    out[k] = base + j
+                    k += 1
+        return out
+
+# Also write the dense (n_prof, n_levels) grids as Zarr for xarray/dask
+# consumers — Parquet is the right sink for SQL, Zarr for chunked random
+# access. Requires zarr + numcodecs, run: pip install zarr
+WRITE_ZARR = False
+
+# Where the per-float profile files live and where the combined output goes
+NC_DIR = "argo_prof_files"
+OUTPUT_PARQUET = "argo_profile.parquet"
+
+# Fixed output schema — every per-file table is built against this, so the
+# shared writer never sees a mismatched column from a file that happens to
+# lack TEMP/PSAL/JULD (those become typed all-null columns instead of
+# pa.null()). QC flags are decoded to strings, never raw NetCDF bytes.
+ARROW_SCHEMA = pa.schema([
+    ("profile_idx", pa.int32()),
+    ("level_idx", pa.int32()),
+    ("latitude", pa.float64()),
+    ("longitude", pa.float64()),
+    ("pressure", pa.float64()),
+    ("temperature", pa.float64()),
+    ("salinity", pa.float64()),
+    ("temp_qc", pa.string()),
+    ("psal_qc", pa.string()),
+    ("pres_qc", pa.string()),
+    ("juld", pa.timestamp("ns")),
+])
 
-# First, let's check the structure of the dataset
-print("Dataset dimensions:", ds.dims)
-print("Dataset variables:", list(ds.variables.keys()))
 
-# Extract variables
-# For profile data, we typically have N_PROF (profiles) and N_LEVELS (depth levels)
-# Some variables are per-profile (like lat/lon), others are per-level (like temp/pres)
+def ingest_file(file_path):
+    """Processes one float's _prof.nc into a pa.Table of valid measurements.
+    Returns None if the file has no PRES variable."""
+    # chunks= backs every variable with dask, so nothing is read or decoded
+    # until .values is touched. Requires dask, run: pip install dask
+    ds = xr.open_dataset(file_path, chunks={"N_PROF": 64})
+
+    if "PRES" not in ds:
+        print(f"❌ PRES variable not found in {file_path}")
+        return None
 
-# Check if these are the actual variable names in your file
-if "PRES" in ds:
     pres = ds["PRES"].values
     temp = ds["TEMP"].values if "TEMP" in ds else None
     psal = ds["PSAL"].values if "PSAL" in ds else None
-    
+
     # Quality control flags
     temp_qc = ds["TEMP_QC"].values if "TEMP_QC" in ds else None
     psal_qc = ds["PSAL_QC"].values if "PSAL_QC" in ds else None
     pres_qc = ds["PRES_QC"].values if "PRES_QC" in ds else None
-    
+
     # Position and time (usually one per profile)
     lat = ds["LATITUDE"].values if "LATITUDE" in ds else None
     lon = ds["LONGITUDE"].values if "LONGITUDE" in ds else None
     juld = ds["JULD"].values if "JULD" in ds else None
-    
-    # Create lists to store flattened data
-    data_list = []
-    
-    # Assuming 2D structure: (n_prof, n_levels)
-    if len(pres.shape) == 2:
-        n_prof, n_levels = pres.shape
-        
-        for i in range(n_prof):
-            for j in range(n_levels):
-                # Skip if pressure is NaN or fill value
-                if not np.isnan(pres[i, j]) and pres[i, j] != 99999:
-                    row = {
-                        "profile_idx": i,
-                        "level_idx": j,
-                        "latitude": lat[i] if lat is not None and len(lat.shape) == 1 else lat[i, j] if lat is not None else None,
-                        "longitude": lon[i] if lon is not None and len(lon.shape) == 1 else lon[i, j] if lon is not None else None,
-                        "pressure": pres[i, j],
-                        "temperature": temp[i, j] if temp is not None else None,
-                        "salinity": psal[i, j] if psal is not None else None,
-                        "temp_qc": temp_qc[i, j] if temp_qc is not None else None,
-                        "psal_qc": psal_qc[i, j] if psal_qc is not None else None,
-                        "pres_qc": pres_qc[i, j] if pres_qc is not None else None,
-                        "juld": juld[i] if juld is not None and len(juld.shape) == 1 else juld[i, j] if juld is not None else None
-                    }
-                    data_list.append(row)
-    
-    # Create DataFrame from list
-    df = pd.DataFrame(data_list)
-    
-    # Save as Parquet
-    df.to_parquet("argo_profile.parquet", index=False)
-    print(f"✅ Saved argo_profile.parquet with {len(df)} records")
-    print(f"DataFrame shape: {df.shape}")
-    print(f"Columns: {df.columns.tolist()}")
-    
-else:
-    print("❌ PRES variable not found in dataset")
-    print("Available variables:", list(ds.variables.keys()))
\ No newline at end of file
+
+    if len(pres.shape) != 2:
+        return None
+    n_prof, n_levels = pres.shape
+
+    # Work on the flat 1-D view: ravel() returns a view (no copy) and a
+    # single flatnonzero gives the valid-cell indices. The profile/level
+    # indices are derived arithmetically instead of materializing full
+    # 2-D index grids.
+    pres_flat = pres.ravel()
+    if HAVE_NUMBA:
+        # Fused check + pack, parallel across profiles
+        idx = valid_flat_indices(pres)
+    else:
+        idx = np.flatnonzero(~np.isnan(pres_flat) & (pres_flat != 99999))
+    prof_idx = idx // n_levels
+    level_idx = idx % n_levels
+
+    def per_profile(arr):
+        # Per-profile (1D) variables index by profile row. Some files
+        # store these per-level (2D), which gather like measurements.
+        if arr is None:
+            return None
+        if len(arr.shape) == 1:
+            return arr[prof_idx]
+        return arr.ravel()[idx]
+
+    def per_level(arr):
+        if arr is None:
+            return None
+        return arr.ravel()[idx]
+
+    def qc_string(arr):
+        # Decode the 1-byte QC flags with np.char.decode (runs in C over
+        # the whole array) — raw bytes in parquet would come out of
+        # push.py's .astype(str) as the literal "b'1'" in Postgres.
+        if arr is None:
+            return None
+        return np.char.decode(arr.ravel()[idx].astype('S1'), 'utf-8')
+
+    def column(values, name):
+        # Arrow column typed from the fixed schema, all-null when the
+        # variable is missing from the file.
+        if values is None:
+            return pa.nulls(idx.size, ARROW_SCHEMA.field(name).type)
+        return pa.array(values, type=ARROW_SCHEMA.field(name).type)
+
+    # Build the table straight from flat columnar arrays
+    table = pa.table({
+        "profile_idx": column(prof_idx, "profile_idx"),
+        "level_idx": column(level_idx, "level_idx"),
+        "latitude": column(per_profile(lat), "latitude"),
+        "longitude": column(per_profile(lon), "longitude"),
+        "pressure": column(pres_flat[idx], "pressure"),
+        "temperature": column(per_level(temp), "temperature"),
+        "salinity": column(per_level(psal), "salinity"),
+        "temp_qc": column(qc_string(temp_qc), "temp_qc"),
+        "psal_qc": column(qc_string(psal_qc), "psal_qc"),
+        "pres_qc": column(qc_string(pres_qc), "pres_qc"),
+        "juld": column(per_profile(juld), "juld"),
+    }, schema=ARROW_SCHEMA)
+
+    if WRITE_ZARR:
+        from numcodecs import Blosc
+
+        # One chunk shape shared by every variable keeps downstream dask
+        # graphs small; blosc-lz4 at level 1 is much faster than zlib.
+        data_vars = {"PRES": (["n_prof", "n_levels"], pres)}
+        if temp is not None:
+            data_vars["TEMP"] = (["n_prof", "n_levels"], temp)
+        if psal is not None:
+            data_vars["PSAL"] = (["n_prof", "n_levels"], psal)
+        zds = xr.Dataset(data_vars)
+        zarr_path = os.path.splitext(os.path.basename(file_path))[0] + ".zarr"
+        zds.to_zarr(
+            zarr_path,
+            mode="w",
+            encoding={v: {"chunks": (32, 512), "compressor": Blosc(cname="lz4", clevel=1)}
+                      for v in zds.data_vars},
+        )
+        print(f"✅ Saved {zarr_path} (chunks aligned at 32 x 512)")
+
+    return table
+
+
+if __name__ == "__main__":
+    nc_files = sorted(glob.glob(os.path.join(NC_DIR, "*_prof.nc")))
+    print(f"Found {len(nc_files)} profile files")
+
+    # Ingestion is embarrassingly parallel across float files; each worker
+    # decodes one NetCDF while the parent serializes the Parquet writes,
+    # one row group per file, through a single shared writer.
+    # Dictionary encoding collapses the low-cardinality QC flag columns to
+    # per-row codes; zstd shrinks the rest. The writer is opened with the
+    # fixed schema, so every per-file table is guaranteed to fit it.
+    writer = pq.ParquetWriter(OUTPUT_PARQUET, ARROW_SCHEMA,
+                              compression="zstd", use_dictionary=True)
+    total_rows = 0
+    with ProcessPoolExecutor(max_workers=os.cpu_count()) as ex:
+        for table in ex.map(ingest_file, nc_files):
+            if table is None or table.num_rows == 0:
+                continue
+            writer.write_table(table)
+            total_rows += table.num_rows
+    writer.close()
+    if total_rows:
+        print(f"✅ Saved {OUTPUT_PARQUET} with {total_rows} records from {len(nc_files)} files")
+    else:
+        print("❌ No valid profile data found")
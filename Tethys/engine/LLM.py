@@ -1,10 +1,22 @@
 # LLM.py
 from retrieval import retrieve_docs
-from huggingface_hub import InferenceClient
+from huggingface_hub import InferenceClient, configure_http_backend
 import os
+import requests
+from requests.adapters import HTTPAdapter
 
 HF_TOKEN = os.getenv("HUGGING_FACE_HUB_TOKEN")
-client = InferenceClient(model="mistralai/Mistral-7B-Instruct-v0.2", token=HF_TOKEN)
+
+# Pooled keep-alive session: repeated chat_completion calls reuse the same
+# connection instead of paying a TLS handshake per query.
+def _pooled_session() -> requests.Session:
+    session = requests.Session()
+    session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=8))
+    return session
+
+configure_http_backend(backend_factory=_pooled_session)
+
+client = InferenceClient(model="mistralai/Mistral-7B-Instruct-v0.2", token=HF_TOKEN, timeout=30)
 
 # BEST PRACTICE: Use the model's preferred instruction format ([INST])
 PROMPT_TEMPLATE = """
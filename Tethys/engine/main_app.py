@@ -64,15 +64,25 @@ def generate_sql(user_query):
     return sql_query
 
 # --- COMPONENT 2: The Security Guard (SQL Sanitizer) ---
-# This component is well-written and requires no changes.
+# Compiled once at import — sanitize_sql runs on every REPL query, so no
+# per-call regex compilation and no full sqlparse tokenization just to
+# check keywords. sqlparse is kept only for the table-name extraction.
+_SQL_COMMENTS = re.compile(r'--[^\n]*|/\*.*?\*/', re.S)
+_FORBIDDEN = re.compile(r'\b(INSERT|UPDATE|DELETE|DROP|ALTER|CREATE|TRUNCATE|GRANT|REVOKE)\b|;', re.IGNORECASE)
+_SELECT_ONLY = re.compile(r'^\s*SELECT\b', re.IGNORECASE)
+
 ALLOWED_TABLES = {"profiles"}
 def sanitize_sql(sql: str) -> str:
-    parsed = sqlparse.format(sql, keyword_case='upper', strip_comments=True).strip()
-    forbidden = ["INSERT", "UPDATE", "DELETE", "DROP", "ALTER", "CREATE", "TRUNCATE", "GRANT", "REVOKE", ";"]
-    for f in forbidden:
-        if re.search(r"\b" + f + r"\b", parsed, flags=re.IGNORECASE):
-            raise ValueError(f"Forbidden SQL keyword found: {f}")
-    if not re.search(r"^\s*SELECT\b", parsed, flags=re.IGNORECASE):
+    # One substitution strips comments; one scan checks all forbidden keywords
+    parsed = _SQL_COMMENTS.sub('', sql).strip()
+    # A single trailing semicolon is normal statement termination (the LLM
+    # is told to emit a complete query); drop it so the ; check below only
+    # catches interior/stacked statements.
+    parsed = parsed.removesuffix(';').rstrip()
+    match = _FORBIDDEN.search(parsed)
+    if match:
+        raise ValueError(f"Forbidden SQL keyword found: {match.group(0).upper()}")
+    if not _SELECT_ONLY.match(parsed):
         raise ValueError("Only SELECT queries are allowed.")
     from_clause = False
     for token in sqlparse.parse(parsed)[0].tokens:
@@ -94,7 +104,8 @@ def run_sql_fetch(sql: str) -> pd.DataFrame:
     safe_sql = sanitize_sql(sql)
     print(f"Safe SQL to be executed:\n{safe_sql}")
     with engine.connect() as conn:
-        df = pd.read_sql(text(safe_sql), conn)
+        # Arrow-backed columns avoid object dtype for the varchar QC flags
+        df = pd.read_sql(text(safe_sql), conn, dtype_backend="pyarrow")
     return df
 
 # === THE MAIN WORKFLOW ===
@@ -3,18 +3,27 @@
 
 import os
 import re
-import sqlparse
+import hashlib
+import json
+import queue
+import threading
+import time
 import pandas as pd
+from collections import OrderedDict
+from concurrent.futures import Future
 from sqlalchemy import create_engine, text
 from sentence_transformers import SentenceTransformer
 import chromadb
-from huggingface_hub import InferenceClient
+import requests
+from requests.adapters import HTTPAdapter
+from huggingface_hub import InferenceClient, configure_http_backend
 from typing import Optional
+import diskcache # Persistent cache that survives restarts, run: pip install diskcache
 
 # --- 1. CONFIGURATION ---
 # Load secrets and configurations from environment variables for security
 HF_TOKEN = os.getenv("HUGGING_FACE_HUB_TOKEN")
-DB_CONNECTION_STRING = os.getenv("DB_CONNECTION_STRING", "postgresql://shaikmohammedomar@localhost:5432/argo")
+DB_CONNECTION_STRING = os.getenv("DB_CONNECTION_STRING", "postgresql+psycopg2://shaikmohammedomar@localhost:5432/argo")
 
 # Model and DB path configurations
 EMBEDDING_MODEL_NAME = "all-MiniLM-L6-v2"
@@ -22,6 +31,31 @@ LLM_MODEL_NAME = "mistralai/Mistral-7B-Instruct-v0.2"
 CHROMA_DB_PATH = "./chroma_db"
 COLLECTION_NAME = "argo_profiles"
 
+# SQL sanitizer patterns, compiled once at import — _sanitize_sql runs on
+# every user query, so keyword checks are a single alternation scan.
+_SQL_COMMENTS = re.compile(r'--[^\n]*|/\*.*?\*/', re.S)
+_FORBIDDEN = re.compile(r'\b(INSERT|UPDATE|DELETE|DROP|ALTER|CREATE|TRUNCATE|GRANT|REVOKE)\b', re.IGNORECASE)
+_SELECT_ONLY = re.compile(r'^\s*SELECT\b', re.IGNORECASE)
+
+# Disk-backed cache for generated SQL — the HF Inference call is the most
+# expensive step in the pipeline (1-3 s), and repeat questions hit it for
+# free, even across restarts.
+_llm_cache = diskcache.Cache("./llm_cache", size_limit=10**9)
+
+
+# One pooled, keep-alive HTTP session shared by every Hub inference call.
+# Without this each chat_completion can pay a fresh TLS handshake; with it
+# the connection to the inference endpoint is reused across SQL generation
+# and summarization.
+def _pooled_session() -> requests.Session:
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=8)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+configure_http_backend(backend_factory=_pooled_session)
+
 
 # --- 2. PROMPT TEMPLATES ---
 SQL_PROMPT_TEMPLATE = """
@@ -52,6 +86,29 @@ Instructions:
 [/INST]
 """
 
+# Preferred prompt: the LLM emits a small JSON query spec instead of raw
+# SQL. build_sql() turns the spec into a SELECT with whitelisted columns
+# and typed literals — safe by construction, no SQL re-parsing needed.
+SQL_SPEC_PROMPT_TEMPLATE = """
+[INST] You are an expert assistant that translates natural language into a JSON query specification for an oceanographic PostgreSQL database.
+
+Database schema:
+Table: profiles (platform_number int, juld timestamptz, latitude double, longitude double, pressure double, temperature double, salinity double, temp_qc varchar, psal_qc varchar, pres_qc varchar)
+
+User request: {user_query}
+Relevant context documents (for guidance only): {context}
+
+Respond ONLY with a JSON object of this exact shape (no explanations, no markdown):
+{"select": ["pressure", "temperature"], "where": {"latitude": [-40, -10], "juld": ["2004-01-01", "2004-12-31"], "temp_qc": "1", "psal_qc": "1"}, "order_by": "pressure DESC", "limit": 50}
+
+Rules:
+- "select" may only use columns from the schema.
+- Each "where" entry maps a column to either a [min, max] range or a single value.
+- Always include "temp_qc": "1" and "psal_qc": "1" in "where".
+- "limit" must be at most 50. For "deepest", use "order_by": "pressure DESC".
+[/INST]
+"""
+
 SUMMARY_PROMPT_TEMPLATE = """
 [INST] You are a data science assistant. Based on the user's original query and the data returned, provide a concise, one-sentence summary of the findings.
 
@@ -67,6 +124,68 @@ Instructions:
 [/INST]
 """
 
+# The templates are split at their placeholders once at import; per call
+# the prompt is a single join of constant parts and the two values, which
+# skips re-parsing the 2-4 KB format string on every query.
+_SQL_HEAD, _rest = SQL_PROMPT_TEMPLATE.split("{user_query}")
+_SQL_MID, _SQL_TAIL = _rest.split("{context}")
+_SPEC_HEAD, _rest = SQL_SPEC_PROMPT_TEMPLATE.split("{user_query}")
+_SPEC_MID, _SPEC_TAIL = _rest.split("{context}")
+_SUMMARY_HEAD, _rest = SUMMARY_PROMPT_TEMPLATE.split("{user_query}")
+_SUMMARY_MID, _SUMMARY_TAIL = _rest.split("{data_head}")
+del _rest
+
+_ALLOWED_COLUMNS = {
+    "platform_number", "profile_idx", "juld", "latitude", "longitude",
+    "pressure", "temperature", "salinity", "temp_qc", "psal_qc", "pres_qc",
+}
+
+
+def _sql_literal(value) -> str:
+    """Renders a spec value as a typed SQL literal."""
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return repr(value)
+    if isinstance(value, str):
+        return "'" + value.replace("'", "''") + "'"
+    raise ValueError(f"Unsupported literal in query spec: {value!r}")
+
+
+def build_sql(spec: dict) -> str:
+    """Builds a SELECT statement from the LLM's JSON query spec.
+
+    Every column is checked against the schema whitelist and every value
+    is emitted as a typed literal, so the resulting SQL cannot contain
+    injected clauses regardless of what the model produced.
+    """
+    select = spec.get("select") or ["*"]
+    if select != ["*"]:
+        bad = set(select) - _ALLOWED_COLUMNS
+        if bad:
+            raise ValueError(f"Unknown columns in spec: {sorted(bad)}")
+    sql = "SELECT " + ", ".join(select) + " FROM profiles"
+
+    conditions = []
+    for col, cond in (spec.get("where") or {}).items():
+        if col not in _ALLOWED_COLUMNS:
+            raise ValueError(f"Unknown column in spec: {col}")
+        if isinstance(cond, list) and len(cond) == 2:
+            conditions.append(f"{col} BETWEEN {_sql_literal(cond[0])} AND {_sql_literal(cond[1])}")
+        else:
+            conditions.append(f"{col} = {_sql_literal(cond)}")
+    if conditions:
+        sql += " WHERE " + " AND ".join(conditions)
+
+    order_by = spec.get("order_by")
+    if order_by:
+        col, _, direction = str(order_by).partition(" ")
+        if col not in _ALLOWED_COLUMNS or direction.upper() not in ("", "ASC", "DESC"):
+            raise ValueError(f"Invalid order_by in spec: {order_by!r}")
+        sql += " ORDER BY " + col + (" " + direction.upper() if direction else "")
+
+    limit = int(spec.get("limit") or 50)
+    sql += f" LIMIT {min(limit, 50)};"
+    return sql
+
 
 # --- 3. THE RAG ENGINE CLASS ---
 class RAG_Engine:
@@ -76,34 +195,131 @@ class RAG_Engine:
         """Initializes all clients and models once."""
         print("Initializing RAG Engine...")
         # LLM Client
-        self.llm_client = InferenceClient(model=LLM_MODEL_NAME, token=HF_TOKEN)
-        # Database Engine
-        self.db_engine = create_engine(DB_CONNECTION_STRING)
+        self.llm_client = InferenceClient(model=LLM_MODEL_NAME, token=HF_TOKEN, timeout=30)
+        # Database Engine (psycopg2 fast execution helpers for batched INSERTs)
+        self.db_engine = create_engine(
+            DB_CONNECTION_STRING,
+            executemany_mode='values_plus_batch',
+            executemany_values_page_size=10_000,
+            executemany_batch_page_size=500,
+        )
         # Embedding Model
         self.embedding_model = SentenceTransformer(EMBEDDING_MODEL_NAME)
         # ChromaDB Client and Collection
         chroma_client = chromadb.PersistentClient(path=CHROMA_DB_PATH)
         self.collection = chroma_client.get_collection(COLLECTION_NAME)
+        # Bounded LRU for retrieved context — repeat queries (REPL turns,
+        # Streamlit reruns) skip the embedding call and the Chroma query.
+        self._context_cache = OrderedDict()
+        self._context_cache_max = 512
+        # Micro-batching queue for query embeddings: concurrent
+        # retrieve_context calls (multiple Streamlit sessions) that land
+        # within a 10 ms window are encoded in one model.encode() batch and
+        # sent to Chroma as one multi-query RPC. Batching k queries through
+        # MiniLM costs barely more than one.
+        self._embed_queue = queue.Queue()
+        self._batch_window_s = 0.010
+        threading.Thread(target=self._embed_worker, daemon=True).start()
         print("✅ RAG Engine Initialized Successfully.")
 
+    def _embed_worker(self):
+        """Drains pending (query, k, future) requests into batched encode +
+        Chroma calls. Runs forever on a daemon thread."""
+        while True:
+            pending = [self._embed_queue.get()]
+            deadline = time.monotonic() + self._batch_window_s
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    pending.append(self._embed_queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            try:
+                # Normalized to match the cosine-space collection: the HNSW
+                # distance check reduces to a plain dot product.
+                embeddings = self.embedding_model.encode(
+                    [q for q, _, _ in pending], batch_size=32,
+                    normalize_embeddings=True
+                ).tolist()
+            except Exception as e:
+                for _, _, fut in pending:
+                    fut.set_exception(e)
+                continue
+            # One Chroma query per distinct k (usually just one)
+            by_k = {}
+            for (_, k, fut), emb in zip(pending, embeddings):
+                by_k.setdefault(k, []).append((fut, emb))
+            for k, items in by_k.items():
+                try:
+                    results = self.collection.query(
+                        query_embeddings=[emb for _, emb in items],
+                        n_results=k,
+                        include=["documents"]
+                    )
+                    for i, (fut, _) in enumerate(items):
+                        fut.set_result("\n".join(results["documents"][i]))
+                except Exception as e:
+                    for fut, _ in items:
+                        fut.set_exception(e)
+
     def retrieve_context(self, query: str, k: int = 3) -> str:
         """Retrieves relevant document summaries from ChromaDB."""
+        cache_key = (query.strip().lower(), k)
+        cached = self._context_cache.get(cache_key)
+        if cached is not None:
+            self._context_cache.move_to_end(cache_key)
+            return cached
+
         print(f"Retrieving context for query: '{query}'")
-        q_emb = self.embedding_model.encode([query]).tolist()
-        results = self.collection.query(
-            query_embeddings=q_emb,
-            n_results=k,
-            include=["documents"]
-        )
-        context = "\n".join(results["documents"][0])
+        # Hand off to the micro-batching worker; blocks until our slot of
+        # the batched Chroma result comes back.
+        fut = Future()
+        self._embed_queue.put((query, k, fut))
+        context = fut.result()
+
+        self._context_cache[cache_key] = context
+        if len(self._context_cache) > self._context_cache_max:
+            self._context_cache.popitem(last=False)
         return context
 
     def generate_sql(self, query: str, context: str) -> str:
-        """Generates a SQL query using the LLM based on the user query and context."""
+        """Generates a SQL query via a structured JSON spec from the LLM.
+
+        The spec path builds the SQL programmatically from whitelisted
+        columns; if the model's JSON can't be parsed or validated, it
+        falls back to the raw-SQL prompt.
+        """
+        cache_key = hashlib.sha256((query + "||" + context).encode()).hexdigest()
+        cached_sql = _llm_cache.get(cache_key)
+        if cached_sql is not None:
+            return cached_sql
+
         print("Generating SQL query...")
-        prompt = SQL_PROMPT_TEMPLATE.format(user_query=query, context=context)
+        prompt = "".join((_SPEC_HEAD, query, _SPEC_MID, context, _SPEC_TAIL))
         messages = [{"role": "user", "content": prompt}]
-        
+
+        response = self.llm_client.chat_completion(messages, max_tokens=300, temperature=0.0)
+        raw = response.choices[0].message.content.strip()
+        try:
+            # Tolerate stray prose/fences around the JSON object
+            start, end = raw.find("{"), raw.rfind("}")
+            if start == -1 or end == -1:
+                raise ValueError("no JSON object in response")
+            sql_query = build_sql(json.loads(raw[start:end + 1]))
+        except (ValueError, TypeError) as e:
+            print(f"⚠️ Could not build SQL from JSON spec ({e}); falling back to raw SQL generation.")
+            sql_query = self._generate_sql_raw(query, context)
+
+        _llm_cache[cache_key] = sql_query
+        return sql_query
+
+    def _generate_sql_raw(self, query: str, context: str) -> str:
+        """Fallback: asks the LLM for free-form SQL (sanitized before execution)."""
+        prompt = "".join((_SQL_HEAD, query, _SQL_MID, context, _SQL_TAIL))
+        messages = [{"role": "user", "content": prompt}]
+
         response = self.llm_client.chat_completion(messages, max_tokens=500, temperature=0.0)
         sql_query = response.choices[0].message.content.strip()
 
@@ -114,17 +330,18 @@ class RAG_Engine:
             sql_query = sql_query.split("```")[0].strip()
         if ';' in sql_query:
             sql_query = sql_query.split(';')[0].strip() + ';'
-            
+
         return sql_query
 
     def _sanitize_sql(self, sql: str) -> str:
         """Strips comments and checks for forbidden keywords."""
-        parsed = sqlparse.format(sql, keyword_case='upper', strip_comments=True).strip()
-        forbidden = ["INSERT", "UPDATE", "DELETE", "DROP", "ALTER", "CREATE", "TRUNCATE", "GRANT", "REVOKE"]
-        for f in forbidden:
-            if re.search(r"\b" + f + r"\b", parsed, flags=re.IGNORECASE):
-                raise ValueError(f"Forbidden SQL keyword found: {f}")
-        if not re.search(r"^\s*SELECT\b", parsed, flags=re.IGNORECASE):
+        # One substitution + two precompiled scans — no full sqlparse
+        # tokenization on the per-query hot path.
+        parsed = _SQL_COMMENTS.sub('', sql).strip()
+        match = _FORBIDDEN.search(parsed)
+        if match:
+            raise ValueError(f"Forbidden SQL keyword found: {match.group(1).upper()}")
+        if not _SELECT_ONLY.match(parsed):
             raise ValueError("Only SELECT queries are allowed.")
         return parsed
 
@@ -134,7 +351,17 @@ class RAG_Engine:
         try:
             safe_sql = self._sanitize_sql(sql)
             with self.db_engine.connect() as conn:
-                df = pd.read_sql(text(safe_sql), conn)
+                # stream_results gives a server-side cursor, so rows arrive
+                # in 5000-row chunks instead of one big fetchall; the chunks
+                # are concatenated once at the end.
+                streaming_conn = conn.execution_options(stream_results=True)
+                # Arrow-backed columns keep the varchar QC flags out of
+                # object dtype — roughly half the memory of numpy backing.
+                chunks = list(pd.read_sql(text(safe_sql), streaming_conn,
+                                          chunksize=5000, dtype_backend="pyarrow"))
+            if not chunks:
+                return pd.DataFrame()
+            df = pd.concat(chunks, ignore_index=True)
             return df
         except Exception as e:
             print(f"❌ SQL Execution Error: {e}")
@@ -147,13 +374,31 @@ class RAG_Engine:
             return "The query returned no results."
         
         print("Summarizing results...")
-        prompt = SUMMARY_PROMPT_TEMPLATE.format(user_query=query, data_head=df.head().to_string())
+        prompt = "".join((_SUMMARY_HEAD, query, _SUMMARY_MID, df.head().to_string(), _SUMMARY_TAIL))
         messages = [{"role": "user", "content": prompt}]
         
         response = self.llm_client.chat_completion(messages, max_tokens=150, temperature=0.1)
         summary = response.choices[0].message.content.strip()
         return summary
-        
+
+    def answer(self, query: str, k: int = 3) -> dict:
+        """Runs the full retrieve -> SQL -> execute -> summarize pipeline.
+
+        Each stage consumes the previous stage's output, so they run in
+        order; concurrency across simultaneous callers comes from the
+        embedding micro-batch worker that retrieve_context hands off to.
+        """
+        context = self.retrieve_context(query, k)
+        sql_query = self.generate_sql(query, context)
+        df = self.execute_sql(sql_query)
+        if df is None:
+            summary = "The SQL query could not be executed."
+        elif df.empty:
+            summary = "The query returned no results."
+        else:
+            summary = self.summarize_results(query, df)
+        return {"summary": summary, "sql": sql_query, "df": df, "context": context}
+
 # --- 4. EXAMPLE USAGE ---
 if __name__ == "__main__":
     # This block allows you to test the engine directly
@@ -4,6 +4,7 @@ import chromadb
 from sentence_transformers import SentenceTransformer
 from sqlalchemy import create_engine
 import pandas as pd
+import numpy as np
 
 
 # --- Step 1: Connect to PostgreSQL and fetch data ---
@@ -18,15 +19,24 @@ df['juld'] = pd.to_datetime(df['juld']).dt.strftime('%Y-%m-%d')
 
 # --- Step 2: Generate summaries using CORRECT column names ---
 print("Generating text summaries for each profile...")
-summaries = [
-    f"Argo float platform {row['platform_number']}, profile index {row['profile_idx']}, "
-    f"located at latitude {row['latitude']:.3f}, longitude {row['longitude']:.3f} on {row['juld']}. "
-    f"Measurement: Temperature {row['temperature']:.2f}°C, Salinity {row['salinity']:.2f} PSU, "
-    f"Pressure {row['pressure']:.1f} dbar."
-    for _, row in df.iterrows()
-]
+# Fully vectorized: np.char.mod formats each numeric column in one C-level
+# pass instead of running a Python format spec per field per row, and the
+# summaries come out of whole-column string concatenation.
+def fmt(col, spec):
+    return pd.Series(np.char.mod(spec, df[col].to_numpy()), index=df.index)
+
+platform = df['platform_number'].astype(str)
+prof_idx = df['profile_idx'].astype(str)
+summaries = (
+    "Argo float platform " + platform + ", profile index " + prof_idx
+    + ", located at latitude " + fmt('latitude', "%.3f")
+    + ", longitude " + fmt('longitude', "%.3f") + " on " + df['juld'] + ". "
+    + "Measurement: Temperature " + fmt('temperature', "%.2f")
+    + "°C, Salinity " + fmt('salinity', "%.2f")
+    + " PSU, Pressure " + fmt('pressure', "%.1f") + " dbar."
+).tolist()
 # Create unique IDs for ChromaDB
-doc_ids = [f"{row['platform_number']}_{row['profile_idx']}_{row['pressure']}" for _, row in df.iterrows()]
+doc_ids = (platform + "_" + prof_idx + "_" + df['pressure'].astype(str)).tolist()
 
 
 # --- Step 3: Load embedding model and create embeddings ---
@@ -34,7 +44,11 @@ print("Loading sentence transformer model...")
 model = SentenceTransformer("sentence-transformers/all-MiniLM-L6-v2")
 
 print("Creating embeddings for summaries...")
-embeddings = model.encode(summaries, show_progress_bar=True)
+# Normalized embeddings + cosine space below: distance becomes a plain
+# dot product, the cheapest comparison HNSW can do per candidate.
+# batch_size=64 keeps the model fed at its preferred batch.
+embeddings = model.encode(summaries, show_progress_bar=True, batch_size=64,
+                          convert_to_numpy=True, normalize_embeddings=True)
 
 
 # --- Step 4: Store in ChromaDB (efficiently) ---
@@ -43,16 +57,37 @@ print("Connecting to ChromaDB and storing data...")
 client = chromadb.PersistentClient(path="./chroma_db") 
 
 
-# Get or create the collection
-collection = client.get_or_create_collection("argo_profiles")
-
-# Bulk add all data at once (much faster than a loop)
-collection.add(
-    ids=doc_ids,
-    documents=summaries,
-    embeddings=embeddings.tolist() # Convert numpy array to list
+# Create the collection with the HNSW index tuned for our small-k queries:
+# cosine space, higher construction quality (ef=200, M=32) and a search ef
+# sized for k=3-5 lookups. Chroma ignores metadata on an existing
+# collection, so any previously built index (the old l2 default) must be
+# dropped — this script rebuilds the vector DB from scratch each run.
+try:
+    client.delete_collection("argo_profiles")
+    print("♻️ Dropped existing 'argo_profiles' collection; rebuilding with cosine HNSW settings.")
+except Exception:
+    pass  # no previous collection
+collection = client.create_collection(
+    "argo_profiles",
+    metadata={
+        "hnsw:space": "cosine",
+        "hnsw:construction_ef": 200,
+        "hnsw:search_ef": 64,
+        "hnsw:M": 32,
+    },
 )
 
+# Upsert in 1000-row chunks: stays under Chroma's batch limit at scale,
+# keeps HNSW additions incremental, and re-running the script is
+# idempotent instead of failing on duplicate IDs.
+CHUNK = 1000
+for s in range(0, len(doc_ids), CHUNK):
+    collection.upsert(
+        ids=doc_ids[s:s+CHUNK],
+        documents=summaries[s:s+CHUNK],
+        embeddings=embeddings[s:s+CHUNK].tolist() # Convert numpy array to list
+    )
+
 print(f"✅ Pushed {collection.count()} profiles into Chroma vector DB")
 
 # --- Example Query to Test ---